@@ -1,39 +1,154 @@
 """History manager for persistent message storage."""
 
 import asyncio
+import functools
+import io
 import json
 import logging
+import mmap
+import os
+import re
+from collections.abc import Generator
+from contextlib import closing
 from datetime import datetime
 from pathlib import Path
-from typing import Any
+from typing import Any, BinaryIO
 
 from mcp_chat.models import PersistedMessage, RoomMetadata
 
+try:
+    import orjson
+except ImportError:  # orjson is an optional speedup, see the "fast" extra
+    orjson = None  # type: ignore[assignment]
+
 logger = logging.getLogger(__name__)
 
+# Maximum number of rooms whose parsed history is kept in memory
+MAX_CACHED_ROOMS = 64
 
-class HistoryManager:
-    """Manages persistent message history using JSON files.
+# Maximum number of decoded messages kept per cached room. Older messages are
+# read back from disk when a request needs them.
+MAX_CACHED_MESSAGES = 1000
+
+# Maximum number of queued messages written to a room's log in one batch
+MAX_BATCH_SIZE = 64
+
+# Reads of older messages that scan more than this run in a worker thread
+OFFLOAD_THRESHOLD_BYTES = 64 * 1024
+
+# Segments larger than this are memory-mapped instead of read through a buffer
+MMAP_THRESHOLD_BYTES = 1 << 20
+
+# Number of messages per history segment file. Must exceed MAX_BATCH_SIZE so a
+# batch spills over into at most one new segment.
+SEGMENT_SIZE = 1000
+
+# Characters replaced when deriving file names from room IDs. \w matches the
+# same Unicode alphanumerics as str.isalnum(), plus the underscore.
+_UNSAFE_ROOM_ID_CHARS = re.compile(r"[^\w-]")
+
+# Fields every stored message dictionary must have
+_REQUIRED_MESSAGE_FIELDS = frozenset({"sender", "content", "timestamp", "message_id"})
+
+# Bytes removed by bytes.strip(), which decides whether a line is empty
+_WHITESPACE_BYTES = b" \t\n\r\x0b\x0c"
+
+# Cache validation stamp: (manifest mtime_ns, tail mtime_ns, tail size)
+_CacheStamp = tuple[int | None, int | None, int | None]
+
+# A queued write: the message dict and the future resolved once it is on disk
+_PendingWrite = tuple[dict[str, Any], asyncio.Future[None]]
+
+
+def _dumps(obj: Any, indent: bool = False) -> bytes:
+    """Serialize to UTF-8 JSON, using orjson when available.
+
+    Output is compact unless indent is set, which is meant for debugging only.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else None)
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _loads(content: bytes | memoryview) -> Any:
+    """Parse UTF-8 JSON, using orjson when available.
+
+    orjson reads memoryviews without copying; stdlib json needs bytes.
+    orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers can
+    catch the stdlib exception for both backends.
+    """
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(bytes(content))
 
-    Storage location: ~/.mcp-chat/history/{room_id}.json
+
+# Room IDs come from clients, so the memo is bounded like the room cache
+@functools.lru_cache(maxsize=1024)
+def _sanitize_room_id(room_id: str) -> str:
+    """Replace characters that are unsafe in file names, memoizing the result."""
+    return _UNSAFE_ROOM_ID_CHARS.sub("_", room_id)
+
+
+def _normalize_message(message: dict[str, Any]) -> dict[str, Any]:
+    """Convert a message stored in an older shape if needed."""
+    if "sender_name" in message or "sender_id" in message:
+        return PersistedMessage.from_dict(message).to_dict()
+    return message
+
+
+class HistoryManager:
+    """Manages persistent message history using append-only JSON Lines segments.
+
+    Storage location: ~/.mcp-chat/history/{room_id}.{NNNN}.jsonl, one message
+    per line and SEGMENT_SIZE messages per segment. A manifest at
+    ~/.mcp-chat/history/{room_id}.manifest.json holds created_at, participants
+    and the message counts of the sealed (full) segments.
+
+    Durability: with fsync_every=1 every written batch is fsynced, together
+    with the manifest and directory, before add_message returns. Larger values
+    fsync every Nth batch per room, so a crash can lose up to N-1 batches.
+    With fsync_every=0 nothing is fsynced. Writes still never leave a
+    half-written manifest, but recent messages may be lost on power failure.
     """
 
-    def __init__(self, base_path: Path | None = None) -> None:
+    def __init__(
+        self, base_path: Path | None = None, pretty: bool = False, fsync_every: int = 1
+    ) -> None:
         """Initialize the history manager.
 
         Args:
             base_path: Base directory for history files.
                       Defaults to ~/.mcp-chat/history/
+            pretty: Indent manifest files so they are easier to read while
+                    debugging. Segments always hold one compact message per line.
+            fsync_every: fsync history files after every Nth batch written to a
+                         room; 0 disables fsync. See the class docstring.
         """
         if base_path is None:
             base_path = Path.home() / ".mcp-chat" / "history"
 
         self._base_path = base_path
+        self._pretty = pretty
+        self._fsync_every = fsync_every
         self._base_path.mkdir(parents=True, exist_ok=True)
 
         # Per-room locks for thread-safe file access
         self._locks: dict[str, asyncio.Lock] = {}
 
+        # LRU cache of parsed room data, invalidated when the files change on disk
+        self._cache: dict[str, tuple[_CacheStamp, dict[str, Any]]] = {}
+
+        # Per-room write queues, each drained by a single flusher task
+        self._queues: dict[str, asyncio.Queue[_PendingWrite]] = {}
+        self._flushers: dict[str, asyncio.Task[None]] = {}
+
+        # Batches written per room since the last fsync
+        self._unsynced_batches: dict[str, int] = {}
+
+        self._migrate_legacy_files()
+
         logger.info(f"HistoryManager initialized with path: {self._base_path}")
 
     def _get_lock(self, room_id: str) -> asyncio.Lock:
@@ -42,148 +157,792 @@ class HistoryManager:
             self._locks[room_id] = asyncio.Lock()
         return self._locks[room_id]
 
-    def _get_room_file_path(self, room_id: str) -> Path:
-        """Get the JSON file path for a room."""
-        # Sanitize room_id to be filesystem-safe
-        safe_room_id = "".join(c if c.isalnum() or c in "-_" else "_" for c in room_id)
-        return self._base_path / f"{safe_room_id}.json"
+    def _get_safe_room_id(self, room_id: str) -> str:
+        """Sanitize room_id to be filesystem-safe."""
+        return _sanitize_room_id(room_id)
 
-    async def _load_room_data(self, room_id: str) -> dict[str, Any]:
-        """Load room data from JSON file.
+    def _get_manifest_path(self, room_id: str) -> Path:
+        """Get the manifest file path for a room."""
+        return self._base_path / f"{self._get_safe_room_id(room_id)}.manifest.json"
 
-        Returns empty structure if file doesn't exist or is corrupted.
+    def _get_segment_path(self, room_id: str, index: int) -> Path:
+        """Get the JSON Lines file path for one of a room's segments."""
+        return self._base_path / f"{self._get_safe_room_id(room_id)}.{index:04d}.jsonl"
+
+    def _new_room_data(self, room_id: str) -> dict[str, Any]:
+        """Create the in-memory structure for a room without history.
+
+        Participants are kept as dict keys, an insertion-ordered set, so
+        membership checks are O(1). They are stored as a list on disk.
+
+        segments holds the line count of every segment, the last entry being
+        the tail that new messages are appended to. messages holds the decoded
+        messages from line window_start (counted across all segments) to the
+        end; older lines are only decoded when a reader asks for them, and
+        the window is trimmed back to MAX_CACHED_MESSAGES afterwards. It has
+        one entry per line, None for a corrupted one, so list positions always
+        line up with window_start.
+        """
+        return {
+            "room_id": room_id,
+            "created_at": datetime.now().isoformat(),
+            "participants": {},
+            "segments": [0],
+            "window_start": 0,
+            "messages": [],
+        }
+
+    def _migrate_legacy_files(self) -> None:
+        """Convert unsegmented history files to the segmented layout.
+
+        Handles both single-document {room_id}.json files and {room_id}.jsonl
+        logs with a {room_id}.meta.json sidecar. Migrated files are kept with
+        a .bak suffix; files that cannot be parsed are renamed aside as
+        .corrupted.<timestamp>.json so they are not retried on every start.
+
+        Segments and the manifest are replaced atomically, and legacy files
+        are only renamed once the manifest is saved. An interrupted migration
+        therefore leaves the legacy files in charge and simply runs again.
+        """
+        sync = self._fsync_every > 0
+        for legacy_path in sorted(self._base_path.iterdir()):
+            # Segments, sidecars and renamed corrupted files have dotted stems
+            if "." in legacy_path.stem or legacy_path.suffix not in (
+                ".json",
+                ".jsonl",
+            ):
+                continue
+
+            manifest_path = legacy_path.with_suffix(".manifest.json")
+            if manifest_path.exists():
+                continue
+
+            meta_path = legacy_path.with_suffix(".meta.json")
+            written_paths: list[Path] = []
+            try:
+                if legacy_path.suffix == ".json":
+                    try:
+                        meta = _loads(legacy_path.read_bytes())
+                    except json.JSONDecodeError as e:
+                        logger.warning(f"Corrupted history file {legacy_path}: {e}")
+                        self._rename_corrupted(legacy_path)
+                        continue
+                    messages = [_normalize_message(m) for m in meta.get("messages", [])]
+                    legacy_paths = [legacy_path]
+                else:
+                    try:
+                        meta = (
+                            _loads(meta_path.read_bytes()) if meta_path.exists() else {}
+                        )
+                    except json.JSONDecodeError as e:
+                        # The messages are still intact, so migrate without it
+                        logger.warning(f"Corrupted history file {meta_path}: {e}")
+                        self._rename_corrupted(meta_path)
+                        meta = {}
+                    messages = []
+                    for line in legacy_path.read_bytes().splitlines():
+                        if line.strip():
+                            message = self._decode_line(legacy_path.stem, line)
+                            if message is not None:
+                                messages.append(message)
+                    legacy_paths = [legacy_path, meta_path]
+
+                segments: list[int] = []
+                for start in range(0, len(messages), SEGMENT_SIZE):
+                    chunk = messages[start : start + SEGMENT_SIZE]
+                    segment_path = legacy_path.with_suffix(
+                        f".{len(segments):04d}.jsonl"
+                    )
+                    self._replace_file(
+                        segment_path, b"".join(_dumps(m) + b"\n" for m in chunk), sync
+                    )
+                    written_paths.append(segment_path)
+                    segments.append(len(chunk))
+
+                manifest = {
+                    "room_id": meta.get("room_id", legacy_path.stem),
+                    "created_at": meta.get("created_at", ""),
+                    "participants": meta.get("participants", []),
+                    # The last segment is the tail and is not recorded
+                    "segments": segments[:-1],
+                }
+                # The manifest commits the migration; legacy files go last
+                self._save_manifest(legacy_path.stem, manifest, sync)
+                if sync:
+                    self._fsync_directory()
+                for path in legacy_paths:
+                    if path.exists():
+                        path.rename(path.with_name(path.name + ".bak"))
+                logger.info(f"Migrated legacy history file {legacy_path}")
+            except Exception as e:
+                logger.error(f"Error migrating legacy history file {legacy_path}: {e}")
+                # Never leave a half-migrated room that could be appended to
+                for path in written_paths:
+                    path.unlink(missing_ok=True)
+
+    def _rename_corrupted(self, file_path: Path) -> None:
+        """Move a corrupted file aside for potential recovery.
+
+        The new name has a dotted stem, so it is never loaded or migrated again.
         """
-        file_path = self._get_room_file_path(room_id)
+        corrupted_path = file_path.with_suffix(
+            f".corrupted.{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        )
+        file_path.rename(corrupted_path)
+        logger.info(f"Renamed corrupted file to {corrupted_path}")
+
+    def _load_manifest(self, room_id: str) -> dict[str, Any] | None:
+        """Load the room manifest.
 
-        if not file_path.exists():
-            return {
-                "room_id": room_id,
-                "created_at": datetime.now().isoformat(),
-                "participants": [],
-                "messages": [],
-            }
+        Returns None if the file doesn't exist or is corrupted.
+        """
+        file_path = self._get_manifest_path(room_id)
 
         try:
-            content = file_path.read_text(encoding="utf-8")
-            data: dict[str, Any] = json.loads(content)
-            return data
+            manifest: dict[str, Any] = _loads(file_path.read_bytes())
+            return manifest
+        except FileNotFoundError:
+            return None
         except json.JSONDecodeError as e:
-            logger.warning(f"Corrupted history file for room {room_id}: {e}")
-            # Rename corrupted file for potential recovery
-            corrupted_path = file_path.with_suffix(
-                f".corrupted.{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+            logger.warning(f"Corrupted manifest file for room {room_id}: {e}")
+            self._rename_corrupted(file_path)
+            return None
+        except Exception as e:
+            logger.error(f"Error loading manifest for room {room_id}: {e}")
+            return None
+
+    def _save_manifest(
+        self, room_id: str, manifest: dict[str, Any], sync: bool = False
+    ) -> None:
+        """Save the room manifest with atomic write, fsyncing it if requested."""
+        try:
+            self._replace_file(
+                self._get_manifest_path(room_id),
+                _dumps(manifest, indent=self._pretty),
+                sync,
             )
-            file_path.rename(corrupted_path)
-            logger.info(f"Renamed corrupted file to {corrupted_path}")
-            return {
-                "room_id": room_id,
-                "created_at": datetime.now().isoformat(),
-                "participants": [],
-                "messages": [],
-            }
         except Exception as e:
-            logger.error(f"Error loading history for room {room_id}: {e}")
-            return {
-                "room_id": room_id,
-                "created_at": datetime.now().isoformat(),
-                "participants": [],
-                "messages": [],
-            }
-
-    async def _save_room_data(self, room_id: str, data: dict[str, Any]) -> None:
-        """Save room data to JSON file with atomic write."""
-        file_path = self._get_room_file_path(room_id)
+            logger.error(f"Error saving manifest for room {room_id}: {e}")
+            raise
+
+    def _replace_file(self, file_path: Path, content: bytes, sync: bool) -> None:
+        """Atomically replace a file's content, fsyncing it if requested."""
         temp_path = file_path.with_suffix(".tmp")
 
         try:
             # Write to temp file first
-            temp_path.write_text(
-                json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8"
-            )
-            # Atomic rename
-            temp_path.rename(file_path)
-        except Exception as e:
-            logger.error(f"Error saving history for room {room_id}: {e}")
+            with temp_path.open("wb") as f:
+                f.write(content)
+                if sync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            # Atomic rename, replacing the old file on every platform
+            os.replace(temp_path, file_path)
+        except Exception:
             # Clean up temp file if it exists
-            if temp_path.exists():
-                temp_path.unlink()
+            temp_path.unlink(missing_ok=True)
             raise
 
-    async def add_message(self, room_id: str, message: PersistedMessage) -> None:
-        """Append a message to room history.
+    def _iter_segment_lines(
+        self, f: BinaryIO
+    ) -> Generator[bytes | memoryview, None, None]:
+        """Yield the complete, non-empty lines of an open segment file.
 
-        Args:
-            room_id: The room ID
-            message: The message to persist
+        A final line without its newline is an unfinished append and is never
+        yielded, so counting and decoding always agree on the number of lines.
+
+        Segments above MMAP_THRESHOLD_BYTES are memory-mapped and lines are
+        yielded as memoryview slices of the mapping, so they can be decoded
+        without an intermediate copy of the file. A slice is only valid until
+        the next line is requested.
+        """
+        size = os.fstat(f.fileno()).st_size
+        if size <= MMAP_THRESHOLD_BYTES:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                if line.strip():
+                    yield line
+            return
+
+        with (
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm,
+            memoryview(mm) as view,
+        ):
+            start = 0
+            while start < size:
+                end = mm.find(b"\n", start)
+                if end == -1:
+                    break
+                # Skip whitespace-only lines like the buffered path, copying
+                # the slice only when its first byte is whitespace
+                if end > start and (
+                    mm[start] not in _WHITESPACE_BYTES or mm[start:end].strip()
+                ):
+                    with view[start:end] as line_view:
+                        yield line_view
+                start = end + 1
+
+    def _truncate_torn_line(self, room_id: str, index: int) -> None:
+        """Cut a segment back to its last newline, dropping a torn final line.
+
+        A crash mid-append can leave a partial line at the end of the tail
+        segment. Appending after it would glue the next message onto the
+        fragment and lose both, so this runs before the tail is counted.
+        """
+        path = self._get_segment_path(room_id, index)
+        try:
+            f = path.open("r+b")
+        except FileNotFoundError:
+            return
+
+        with f:
+            size = f.seek(0, os.SEEK_END)
+            end = size
+            # Scan backwards for the last newline; torn lines are short
+            while end > 0:
+                block_start = max(end - io.DEFAULT_BUFFER_SIZE, 0)
+                f.seek(block_start)
+                newline = f.read(end - block_start).rfind(b"\n")
+                if newline != -1:
+                    end = block_start + newline + 1
+                    break
+                end = block_start
+            if end == size:
+                return
+
+            f.truncate(end)
+            if self._fsync_every > 0:
+                os.fsync(f.fileno())
+        logger.warning(f"Truncated {size - end} byte(s) of a torn line from {path}")
+
+    def _count_segment_lines(self, room_id: str, index: int) -> int:
+        """Count a segment's lines without decoding any of them."""
+        try:
+            f = self._get_segment_path(room_id, index).open("rb")
+        except FileNotFoundError:
+            return 0
+
+        with f, closing(self._iter_segment_lines(f)) as lines:
+            return sum(1 for _ in lines)
+
+    def _read_segment(
+        self, room_id: str, index: int, start: int = 0, stop: int | None = None
+    ) -> list[dict[str, Any] | None]:
+        """Decode lines start..stop-1 of a segment.
+
+        Lines before start are scanned but never decoded, so reading the tail
+        of a segment only allocates the messages that are returned. Corrupted
+        lines decode to None, keeping every entry at its line's position.
         """
+        try:
+            f = self._get_segment_path(room_id, index).open("rb")
+        except FileNotFoundError:
+            return []
+
+        messages: list[dict[str, Any] | None] = []
+        with f, closing(self._iter_segment_lines(f)) as lines:
+            for position, line in enumerate(lines):
+                if stop is not None and position >= stop:
+                    break
+                if position >= start:
+                    messages.append(self._decode_line(room_id, line))
+        return messages
+
+    def _decode_line(
+        self, room_id: str, line: bytes | memoryview
+    ) -> dict[str, Any] | None:
+        """Decode one history line, returning None if it is corrupted."""
+        try:
+            message: dict[str, Any] = _normalize_message(_loads(line))
+            return message
+        except json.JSONDecodeError as e:
+            # Torn tails are truncated on load, so this means outside damage
+            logger.warning(f"Skipping corrupted history line in {room_id}: {e}")
+            return None
+
+    def _read_ranges(
+        self, room_id: str, ranges: list[tuple[int, int, int]]
+    ) -> list[dict[str, Any] | None]:
+        """Decode and concatenate (segment, start, stop) line ranges."""
+        messages: list[dict[str, Any] | None] = []
+        for index, start, stop in ranges:
+            messages.extend(self._read_segment(room_id, index, start, stop))
+        return messages
+
+    def _scan_sealed_segments(self, room_id: str) -> list[int] | None:
+        """Rebuild sealed segment counts from disk when the manifest is missing.
+
+        Returns None if the room has no segment files at all.
+        """
+        if not self._get_segment_path(room_id, 0).exists():
+            return None
+
+        counts: list[int] = []
+        while self._get_segment_path(room_id, len(counts) + 1).exists():
+            counts.append(self._count_segment_lines(room_id, len(counts)))
+        return counts
+
+    def _get_segment_size(self, room_id: str, index: int) -> int:
+        """Get a segment's size in bytes, 0 if it doesn't exist."""
+        try:
+            return self._get_segment_path(room_id, index).stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def _get_cache_stamp(self, room_id: str, tail_index: int) -> _CacheStamp:
+        """Stat the room's files to detect changes made outside this process."""
+        try:
+            manifest_mtime: int | None = (
+                self._get_manifest_path(room_id).stat().st_mtime_ns
+            )
+        except FileNotFoundError:
+            manifest_mtime = None
+        try:
+            tail_stat = self._get_segment_path(room_id, tail_index).stat()
+        except FileNotFoundError:
+            return (manifest_mtime, None, None)
+        return (manifest_mtime, tail_stat.st_mtime_ns, tail_stat.st_size)
+
+    def _cache_room_data(
+        self, room_id: str, stamp: _CacheStamp, data: dict[str, Any]
+    ) -> None:
+        """Store parsed room data as the most recently used cache entry."""
+        self._cache.pop(room_id, None)
+        self._cache[room_id] = (stamp, data)
+        if len(self._cache) > MAX_CACHED_ROOMS:
+            # Dicts keep insertion order, so the first key is least recently used
+            del self._cache[next(iter(self._cache))]
+
+    def _get_line_ranges(
+        self, segments: list[int], start: int, stop: int
+    ) -> list[tuple[int, int, int]]:
+        """Map absolute lines start..stop-1 onto (segment, start, stop) ranges."""
+        ranges: list[tuple[int, int, int]] = []
+        segment_start = 0
+        for index, count in enumerate(segments):
+            segment_end = segment_start + count
+            if segment_end > start:
+                ranges.append(
+                    (
+                        index,
+                        max(start, segment_start) - segment_start,
+                        min(stop, segment_end) - segment_start,
+                    )
+                )
+            if segment_end >= stop:
+                break
+            segment_start = segment_end
+        return ranges
+
+    async def _load_older_messages(
+        self, room_id: str, data: dict[str, Any], limit: int | None
+    ) -> None:
+        """Extend the cached messages backwards until they hold `limit` messages.
+
+        Decodes every older line when limit is None. Small reads run inline;
+        reads from segments over OFFLOAD_THRESHOLD_BYTES in total run in a
+        worker thread. Must be called with the room lock held.
+        """
+        window_start: int = data["window_start"]
+        target = 0 if limit is None else max(sum(data["segments"]) - limit, 0)
+        if target >= window_start:
+            return
+
+        ranges = self._get_line_ranges(data["segments"], target, window_start)
+        # Lines before each range's start are scanned too, so go by file size
+        scan_size = sum(
+            self._get_segment_size(room_id, index) for index, _, _ in ranges
+        )
+        if scan_size > OFFLOAD_THRESHOLD_BYTES:
+            older = await asyncio.to_thread(self._read_ranges, room_id, ranges)
+        else:
+            older = self._read_ranges(room_id, ranges)
+        data["messages"][:0] = older
+        data["window_start"] = target
+
+    def _trim_cached_messages(self, data: dict[str, Any]) -> None:
+        """Drop the oldest decoded messages beyond MAX_CACHED_MESSAGES."""
+        excess = len(data["messages"]) - MAX_CACHED_MESSAGES
+        if excess > 0:
+            del data["messages"][:excess]
+            data["window_start"] += excess
+
+    def _get_cached_room_data(self, room_id: str) -> dict[str, Any] | None:
+        """Return the cached room data if the room's files are unchanged on disk.
+
+        Safe to call without the room lock: code holding the lock applies
+        related updates to a cached dict without awaiting in between, so the
+        snapshot seen here is always consistent.
+        """
+        cached = self._cache.get(room_id)
+        if cached is None:
+            return None
+
+        stamp, data = cached
+        if self._get_cache_stamp(room_id, len(data["segments"]) - 1) != stamp:
+            return None
+        self._cache_room_data(room_id, stamp, data)
+        return data
+
+    def _read_room_data(
+        self, room_id: str
+    ) -> tuple[_CacheStamp, dict[str, Any]] | None:
+        """Read a room's manifest, segment sizes and last message from disk.
+
+        Also scans for sealed segments when the manifest is missing and
+        truncates a torn tail, so all of a cache miss's disk I/O happens in
+        this one call, run in a worker thread by _load_room_data. Returns None
+        if no history exists for the room.
+        """
+        data = self._new_room_data(room_id)
+        manifest = self._load_manifest(room_id)
+        if manifest is not None:
+            data["created_at"] = manifest.get("created_at", "")
+            data["participants"] = dict.fromkeys(manifest.get("participants", []))
+            sealed: list[int] = manifest.get("segments", [])
+        else:
+            scanned = self._scan_sealed_segments(room_id)
+            if scanned is None:
+                return None
+            sealed = scanned
+
+        tail_index = len(sealed)
+        self._truncate_torn_line(room_id, tail_index)
+        stamp = self._get_cache_stamp(room_id, tail_index)
+        data["segments"] = [*sealed, self._count_segment_lines(room_id, tail_index)]
+
+        # Keep the last message at hand for last_activity
+        total = sum(data["segments"])
+        window_start = max(total - 1, 0)
+        data["messages"] = self._read_ranges(
+            room_id, self._get_line_ranges(data["segments"], window_start, total)
+        )
+        data["window_start"] = window_start
+        return stamp, data
+
+    async def _load_room_data(self, room_id: str) -> dict[str, Any] | None:
+        """Load room metadata and segment sizes, using the cache when valid.
+
+        A cache miss reads the room from disk in a worker thread (see
+        _read_room_data); _load_older_messages pulls in older lines as
+        readers need them.
+
+        Returns None if no history exists for the room. The returned dict is
+        owned by the cache and must only be mutated while holding the room lock,
+        never across an await (see _get_cached_room_data).
+        """
+        cached_data = self._get_cached_room_data(room_id)
+        if cached_data is not None:
+            return cached_data
+
+        loaded = await asyncio.to_thread(self._read_room_data, room_id)
+        if loaded is None:
+            self._cache.pop(room_id, None)
+            return None
+
+        stamp, data = loaded
+        self._cache_room_data(room_id, stamp, data)
+        return data
+
+    def _fsync_directory(self) -> None:
+        """fsync the history directory so new and renamed files survive a crash."""
+        if os.name == "nt":
+            # Windows cannot open directories for fsync
+            return
+        fd = os.open(self._base_path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _should_sync(self, room_id: str) -> bool:
+        """Count a batch for the room and report whether it should be fsynced."""
+        if self._fsync_every <= 0:
+            return False
+        unsynced = self._unsynced_batches.pop(room_id, 0) + 1
+        if unsynced < self._fsync_every:
+            self._unsynced_batches[room_id] = unsynced
+            return False
+        return True
+
+    def _write_room_files(
+        self,
+        room_id: str,
+        tail_index: int,
+        chunks: list[tuple[int, bytes]],
+        manifest: dict[str, Any] | None,
+        sync: bool,
+    ) -> _CacheStamp:
+        """Append encoded lines to segments and save the manifest if given.
+
+        tail_index is the tail segment before this batch. The manifest is
+        saved before the first chunk that goes past it, so a segment is only
+        written once every segment before it is recorded as sealed, and only
+        after the chunk that filled them. With sync, each file is fsynced
+        before the next step, so the whole batch costs one round of fsyncs.
+        The directory is only fsynced when the manifest changed, since that is
+        the only time a file is created or renamed. Runs in a worker thread so
+        disk latency never blocks the event loop. Returns the cache stamp after
+        writing.
+        """
+        pending_manifest = manifest
+        for index, payload in chunks:
+            if pending_manifest is not None and index > tail_index:
+                self._save_manifest(room_id, pending_manifest, sync)
+                pending_manifest = None
+            with open(self._get_segment_path(room_id, index), "ab") as f:
+                f.write(payload)
+                if sync:
+                    f.flush()
+                    os.fsync(f.fileno())
+        if pending_manifest is not None:
+            self._save_manifest(room_id, pending_manifest, sync)
+        if sync and manifest is not None:
+            self._fsync_directory()
+        return self._get_cache_stamp(room_id, chunks[-1][0])
+
+    async def _write_batch(self, room_id: str, messages: list[dict[str, Any]]) -> None:
+        """Append a batch of messages to the room's tail segment."""
         lock = self._get_lock(room_id)
         async with lock:
             data = await self._load_room_data(room_id)
+            manifest_changed = data is None
+            if data is None:
+                data = self._new_room_data(room_id)
+
+            # Work on copies and apply them to the cached dict only once the
+            # write has landed, so lock-free readers never see a partial batch
+            participants: dict[str, None] = data["participants"]
+            new_participants = [
+                sender
+                for sender in dict.fromkeys(m["sender"] for m in messages)
+                if sender not in participants
+            ]
+            if new_participants:
+                manifest_changed = True
+
+            # Split the batch across the tail segment and, if it fills up, a new one
+            lines = [_dumps(m) + b"\n" for m in messages]
+            segments: list[int] = data["segments"][:]
+            chunks: list[tuple[int, bytes]] = []
+            position = 0
+            while position < len(lines):
+                if segments[-1] >= SEGMENT_SIZE:
+                    segments.append(0)
+                    manifest_changed = True
+                take = min(SEGMENT_SIZE - segments[-1], len(lines) - position)
+                chunks.append(
+                    (len(segments) - 1, b"".join(lines[position : position + take]))
+                )
+                segments[-1] += take
+                position += take
+
+            manifest = (
+                {
+                    "room_id": data["room_id"],
+                    "created_at": data["created_at"],
+                    "participants": [*participants, *new_participants],
+                    "segments": segments[:-1],
+                }
+                if manifest_changed
+                else None
+            )
 
-            # Update participants if not already present
-            if message.sender_name not in data["participants"]:
-                data["participants"].append(message.sender_name)
+            try:
+                stamp = await asyncio.to_thread(
+                    self._write_room_files,
+                    room_id,
+                    len(data["segments"]) - 1,
+                    chunks,
+                    manifest,
+                    self._should_sync(room_id),
+                )
+            except Exception as e:
+                # The cached dict is untouched; its stamp no longer matches if
+                # any of the batch reached disk, forcing a reload
+                logger.error(f"Error saving history for room {room_id}: {e}")
+                raise
+
+            participants.update(dict.fromkeys(new_participants))
+            data["segments"] = segments
+            data["messages"].extend(messages)
+            self._trim_cached_messages(data)
+            self._cache_room_data(room_id, stamp, data)
+            logger.debug(f"Persisted {len(messages)} message(s) in room {room_id}")
+
+    async def _flush_queue(self, room_id: str) -> None:
+        """Drain a room's write queue, persisting queued messages in batches."""
+        queue = self._queues[room_id]
+        while not queue.empty():
+            batch = [queue.get_nowait()]
+            while not queue.empty() and len(batch) < MAX_BATCH_SIZE:
+                batch.append(queue.get_nowait())
+
+            try:
+                await self._write_batch(room_id, [message for message, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
+
+        # Nothing can be queued between the empty check and here, so the next
+        # add_message will start a fresh flusher
+        self._queues.pop(room_id, None)
+        self._flushers.pop(room_id, None)
+
+    async def add_message(
+        self, room_id: str, message: PersistedMessage | dict[str, Any]
+    ) -> None:
+        """Append a message to room history.
 
-            # Append message
-            data["messages"].append(message.to_dict())
+        Messages sent while a write for the same room is in progress are
+        queued and written together. Returns once the message is on disk.
 
-            # Save
-            await self._save_room_data(room_id, data)
-            logger.debug(f"Persisted message {message.message_id} in room {room_id}")
+        Args:
+            room_id: The room ID
+            message: The message to persist, either as a PersistedMessage or
+                     already in the stored dictionary shape (see to_dict)
 
-    async def get_history(
+        Raises:
+            ValueError: If a message dictionary lacks required fields. It is
+                        rejected before queueing, so other writers are unaffected.
+        """
+        if isinstance(message, PersistedMessage):
+            message = message.to_dict()
+        else:
+            try:
+                message = _normalize_message(message)
+            except KeyError as e:
+                raise ValueError(f"Message is missing required field {e}") from e
+            missing = _REQUIRED_MESSAGE_FIELDS - message.keys()
+            if missing:
+                raise ValueError(
+                    f"Message is missing required fields: {', '.join(sorted(missing))}"
+                )
+
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        if room_id not in self._queues:
+            self._queues[room_id] = asyncio.Queue()
+        self._queues[room_id].put_nowait((message, future))
+
+        if room_id not in self._flushers:
+            self._flushers[room_id] = asyncio.create_task(self._flush_queue(room_id))
+
+        await future
+
+    def _build_room_metadata(self, room_id: str, data: dict[str, Any]) -> RoomMetadata:
+        """Build RoomMetadata from loaded room data."""
+        last_activity = next(
+            (m["timestamp"] for m in reversed(data["messages"]) if m is not None),
+            data.get("created_at", ""),
+        )
+
+        return RoomMetadata(
+            room_id=room_id,
+            created_at=data.get("created_at", ""),
+            last_activity=last_activity,
+            message_count=sum(data["segments"]),
+            participants=list(data["participants"]),
+            active=True,  # Will be overridden by live room data
+        )
+
+    async def get_status_and_tail(
         self, room_id: str, limit: int | None = None
-    ) -> list[PersistedMessage]:
-        """Get message history for a room.
+    ) -> tuple[RoomMetadata | None, list[dict[str, Any]]]:
+        """Get room metadata and recent messages from a single load.
+
+        Callers that need both, like the get_history tool reporting
+        total_count alongside messages, avoid a second lock and cache check.
+        The message dictionaries are shared with the cache and must not be
+        mutated.
 
         Args:
             room_id: The room ID
             limit: Optional maximum number of messages to return (most recent)
 
         Returns:
-            List of messages, ordered chronologically
+            Room metadata (None if no history exists) and the message
+            dictionaries, ordered chronologically. Corrupted lines count
+            towards limit but are left out.
         """
+        if limit is not None and limit <= 0:
+            limit = None
+
         lock = self._get_lock(room_id)
         async with lock:
             data = await self._load_room_data(room_id)
+            if data is None:
+                return None, []
+            await self._load_older_messages(room_id, data, limit)
+
+            # Slice before returning so callers never hold the live cached list
+            window: list[dict[str, Any] | None] = data["messages"]
+            if limit is not None:
+                window = window[-limit:]
+            tail = [m for m in window if m is not None]
+            self._trim_cached_messages(data)
+            return self._build_room_metadata(room_id, data), tail
+
+    async def get_history_raw(
+        self, room_id: str, limit: int | None = None
+    ) -> list[dict[str, Any]]:
+        """Get message history for a room as stored dictionaries.
 
-        messages = [PersistedMessage.from_dict(m) for m in data.get("messages", [])]
+        The dictionaries are shared with the cache and must not be mutated.
 
-        if limit is not None and limit > 0:
-            messages = messages[-limit:]
+        Args:
+            room_id: The room ID
+            limit: Optional maximum number of messages to return (most recent)
 
+        Returns:
+            List of message dictionaries in the get_history tool's shape,
+            ordered chronologically
+        """
+        _, messages = await self.get_status_and_tail(room_id, limit)
         return messages
 
+    async def get_history(
+        self, room_id: str, limit: int | None = None
+    ) -> list[PersistedMessage]:
+        """Get message history for a room.
+
+        Args:
+            room_id: The room ID
+            limit: Optional maximum number of messages to return (most recent)
+
+        Returns:
+            List of messages, ordered chronologically
+        """
+        raw_messages = await self.get_history_raw(room_id, limit)
+        return [PersistedMessage.from_dict(m, room_id) for m in raw_messages]
+
     async def get_message_count(self, room_id: str) -> int:
         """Get total message count for a room."""
-        lock = self._get_lock(room_id)
-        async with lock:
-            data = await self._load_room_data(room_id)
-        return len(data.get("messages", []))
+        data = self._get_cached_room_data(room_id)
+        if data is None:
+            lock = self._get_lock(room_id)
+            async with lock:
+                data = await self._load_room_data(room_id)
+        return sum(data["segments"]) if data is not None else 0
 
     async def get_room_metadata(self, room_id: str) -> RoomMetadata | None:
-        """Get metadata about a room from its history file.
+        """Get metadata about a room from its history files.
 
         Returns None if no history exists for the room.
         """
-        file_path = self._get_room_file_path(room_id)
-        if not file_path.exists():
-            return None
-
-        lock = self._get_lock(room_id)
-        async with lock:
-            data = await self._load_room_data(room_id)
-
-        messages = data.get("messages", [])
-        last_activity = (
-            messages[-1]["timestamp"] if messages else data.get("created_at", "")
-        )
-
-        return RoomMetadata(
-            room_id=room_id,
-            created_at=data.get("created_at", ""),
-            last_activity=last_activity,
-            message_count=len(messages),
-            participants=data.get("participants", []),
-            active=True,  # Will be overridden by live room data
-        )
+        # A valid cached snapshot needs no lock; otherwise only the load is
+        # locked and the metadata is built after releasing it
+        data = self._get_cached_room_data(room_id)
+        if data is None:
+            lock = self._get_lock(room_id)
+            async with lock:
+                data = await self._load_room_data(room_id)
+            if data is None:
+                return None
+
+        return self._build_room_metadata(room_id, data)
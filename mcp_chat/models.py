@@ -6,26 +6,32 @@ from typing import Any, Optional
 import uuid
 
 
-@dataclass
+@dataclass(slots=True)
 class User:
     """Represents a connected user."""
 
-    user_id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    user_id: str = field(default_factory=lambda: uuid.uuid4().hex)
     display_name: Optional[str] = None
     connection_id: str = ""  # SSE connection identifier
     joined_at: datetime = field(default_factory=datetime.now)
+    # Resolved once in __post_init__; name is read on every message
+    _name: str = field(init=False, repr=False, compare=False, default="")
+
+    def __post_init__(self) -> None:
+        """Resolve the display name once at construction."""
+        self._name = self.display_name or f"Anonymous-{self.user_id[:8]}"
 
     @property
     def name(self) -> str:
         """Get display name or anonymous identifier."""
-        return self.display_name or f"Anonymous-{self.user_id[:8]}"
+        return self._name
 
 
-@dataclass
+@dataclass(slots=True)
 class ChatRoom:
     """Represents an active chat room between two users."""
 
-    room_id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    room_id: str = field(default_factory=lambda: uuid.uuid4().hex)
     user1: User = field(default_factory=User)
     user2: User = field(default_factory=User)
     created_at: datetime = field(default_factory=datetime.now)
@@ -44,20 +50,24 @@ class ChatRoom:
         return user_id in (self.user1.user_id, self.user2.user_id)
 
 
-@dataclass
+@dataclass(slots=True)
 class Message:
     """Represents a chat message."""
 
-    message_id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    message_id: str = field(default_factory=lambda: uuid.uuid4().hex)
     room_id: str = ""
     sender_id: str = ""
     content: str = ""
     timestamp: datetime = field(default_factory=datetime.now)
 
 
-@dataclass
+@dataclass(slots=True)
 class PersistedMessage:
-    """Message format for JSON persistence."""
+    """Message format for JSON persistence.
+
+    Stored messages use exactly the dictionary shape the get_history tool
+    returns, so history is served without rebuilding each message.
+    """
 
     message_id: str
     room_id: str
@@ -68,32 +78,38 @@ class PersistedMessage:
     is_system: bool = False
 
     def to_dict(self) -> dict[str, Any]:
-        """Convert to dictionary for JSON serialization."""
+        """Convert to dictionary for JSON serialization.
+
+        room_id is omitted since it is implied by the room's history file,
+        and sender_id since it is internal and only valid for one connection.
+        """
         return {
-            "message_id": self.message_id,
-            "room_id": self.room_id,
-            "sender_id": self.sender_id,
-            "sender_name": self.sender_name,
+            "sender": self.sender_name,
             "content": self.content,
             "timestamp": self.timestamp,
+            "message_id": self.message_id,
             "is_system": self.is_system,
         }
 
     @classmethod
-    def from_dict(cls, data: dict[str, Any]) -> "PersistedMessage":
-        """Create from dictionary."""
+    def from_dict(cls, data: dict[str, Any], room_id: str = "") -> "PersistedMessage":
+        """Create from dictionary.
+
+        Also accepts the older shape that stored sender_name, room_id and
+        sender_id. sender_id is empty for messages stored without it.
+        """
         return cls(
             message_id=data["message_id"],
-            room_id=data["room_id"],
-            sender_id=data["sender_id"],
-            sender_name=data["sender_name"],
+            room_id=data.get("room_id", room_id),
+            sender_id=data.get("sender_id", ""),
+            sender_name=data["sender"] if "sender" in data else data["sender_name"],
             content=data["content"],
             timestamp=data["timestamp"],
             is_system=data.get("is_system", False),
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class RoomMetadata:
     """Room metadata for status queries."""
 
@@ -27,6 +27,9 @@ history_manager = HistoryManager()
 # Store active connections (connection_id -> User)
 connections: Dict[str, User] = {}
 
+# Reverse index of active connections (user_id -> connection_id)
+user_to_conn: Dict[str, str] = {}
+
 
 @mcp.tool()
 async def join_room(room_id: str, display_name: str) -> Dict[str, Any]:
@@ -44,11 +47,15 @@ async def join_room(room_id: str, display_name: str) -> Dict[str, Any]:
         Success status with client_id, or error information
     """
     # Generate a unique client_id for this user
-    connection_id = str(uuid.uuid4())
+    connection_id = uuid.uuid4().hex
+    joined_at = datetime.now()
 
     # Create new user
-    user = User(display_name=display_name, connection_id=connection_id)
+    user = User(
+        display_name=display_name, connection_id=connection_id, joined_at=joined_at
+    )
     connections[connection_id] = user
+    user_to_conn[user.user_id] = connection_id
 
     # Check if room exists
     room = await room_manager.get_room(room_id)
@@ -79,13 +86,12 @@ async def join_room(room_id: str, display_name: str) -> Dict[str, Any]:
 
     # Check if room has space (max 2 users)
     current_users = []
-    active_user_ids = {u.user_id for u in connections.values()}
-    if room.user1 and room.user1.user_id in active_user_ids:
+    if room.user1 and room.user1.user_id in user_to_conn:
         current_users.append(room.user1)
     if (
         room.user2
         and room.user2.user_id != room.user1.user_id
-        and room.user2.user_id in active_user_ids
+        and room.user2.user_id in user_to_conn
     ):
         current_users.append(room.user2)
 
@@ -101,8 +107,8 @@ async def join_room(room_id: str, display_name: str) -> Dict[str, Any]:
         room.user2 = user
 
         # Persist system join message
-        join_msg_id = str(uuid.uuid4())
-        join_timestamp = datetime.now().isoformat()
+        join_msg_id = uuid.uuid4().hex
+        join_timestamp = joined_at.isoformat()
         persisted_join = PersistedMessage(
             message_id=join_msg_id,
             room_id=room_id,
@@ -182,6 +188,7 @@ async def send_message(room_id: str, message: str, client_id: str) -> Dict[str,
 
     # Create message
     msg = Message(room_id=room_id, sender_id=user.user_id, content=message)
+    timestamp = msg.timestamp.isoformat()
 
     # Log message
     logger.info(f"Message from {user.name} to {partner.name}: {message[:50]}...")
@@ -193,7 +200,7 @@ async def send_message(room_id: str, message: str, client_id: str) -> Dict[str,
         sender_id=user.user_id,
         sender_name=user.name,
         content=message,
-        timestamp=msg.timestamp.isoformat(),
+        timestamp=timestamp,
         is_system=False,
     )
     await history_manager.add_message(room_id, persisted_msg)
@@ -206,14 +213,14 @@ async def send_message(room_id: str, message: str, client_id: str) -> Dict[str,
             "room_id": room_id,
             "message": message,
             "sender": {"user_id": user.user_id, "display_name": user.name},
-            "timestamp": msg.timestamp.isoformat(),
+            "timestamp": timestamp,
         },
     )
 
     return {
         "success": True,
         "message_id": msg.message_id,
-        "timestamp": msg.timestamp.isoformat(),
+        "timestamp": timestamp,
     }
 
 
@@ -258,7 +265,7 @@ async def leave_chat(room_id: str, client_id: str) -> Dict[str, Any]:
     logger.info(f"User {user.name} left room {room_id}")
 
     # Persist system leave message
-    leave_msg_id = str(uuid.uuid4())
+    leave_msg_id = uuid.uuid4().hex
     leave_timestamp = datetime.now().isoformat()
     persisted_leave = PersistedMessage(
         message_id=leave_msg_id,
@@ -301,21 +308,13 @@ async def get_history(room_id: str, limit: int | None = None) -> Dict[str, Any]:
     Returns:
         room_id, messages list, and total_count
     """
-    messages = await history_manager.get_history(room_id, limit)
-    total_count = await history_manager.get_message_count(room_id)
+    metadata, messages = await history_manager.get_status_and_tail(room_id, limit)
+    total_count = metadata.message_count if metadata else 0
 
     return {
         "room_id": room_id,
-        "messages": [
-            {
-                "sender": m.sender_name,
-                "content": m.content,
-                "timestamp": m.timestamp,
-                "message_id": m.message_id,
-                "is_system": m.is_system,
-            }
-            for m in messages
-        ],
+        # Stored messages are already in the response shape
+        "messages": messages,
         "total_count": total_count,
     }
 
@@ -414,6 +413,7 @@ async def handle_disconnect(connection_id: str) -> None:
 
     # Remove from connections
     connections.pop(connection_id, None)
+    user_to_conn.pop(user.user_id, None)
     logger.info(f"User {user.name} disconnected")
 
 
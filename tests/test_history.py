@@ -0,0 +1,395 @@
+"""Tests for persistent message history."""
+
+import asyncio
+import json
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from mcp_chat import history as history_module
+from mcp_chat.history import HistoryManager
+from mcp_chat.models import PersistedMessage
+
+
+def make_message(index: int, sender: str = "Alice") -> PersistedMessage:
+    """Create a numbered test message."""
+    return PersistedMessage(
+        message_id=f"msg-{index}",
+        room_id="room",
+        sender_id=f"user-{sender}",
+        sender_name=sender,
+        content=f"message {index}",
+        timestamp=f"2025-01-01T00:00:{index % 60:02d}",
+    )
+
+
+def contents(messages: list[dict[str, object]]) -> list[object]:
+    """Extract message contents for compact assertions."""
+    return [m["content"] for m in messages]
+
+
+def test_torn_tail_is_truncated_before_appending(tmp_path: Path) -> None:
+    """A partial line left by a crash must not swallow the next message."""
+
+    async def write_then_tear() -> None:
+        history = HistoryManager(tmp_path)
+        for index in range(3):
+            await history.add_message("room", make_message(index))
+
+    asyncio.run(write_then_tear())
+    with (tmp_path / "room.0000.jsonl").open("ab") as f:
+        f.write(b'{"sender":"Alice","content":"mess')
+
+    async def restart_and_append() -> None:
+        history = HistoryManager(tmp_path)
+        assert await history.get_message_count("room") == 3
+        await history.add_message("room", make_message(3))
+
+    asyncio.run(restart_and_append())
+
+    async def restart_and_read() -> tuple[list[dict[str, object]], int]:
+        history = HistoryManager(tmp_path)
+        return (
+            await history.get_history_raw("room"),
+            await history.get_message_count("room"),
+        )
+
+    messages, count = asyncio.run(restart_and_read())
+    assert contents(messages) == [f"message {i}" for i in range(4)]
+    assert count == 4
+
+
+def test_message_count_matches_messages_after_torn_tail(tmp_path: Path) -> None:
+    """message_count must equal the number of messages get_history can return."""
+
+    async def scenario() -> None:
+        history = HistoryManager(tmp_path)
+        for index in range(3):
+            await history.add_message("room", make_message(index))
+
+        with (tmp_path / "room.0000.jsonl").open("ab") as f:
+            f.write(b'{"sender":"Alice","content":"mess')
+        await history.add_message("room", make_message(3))
+
+        metadata = await history.get_room_metadata("room")
+        messages = await history.get_history_raw("room")
+        assert metadata is not None
+        assert metadata.message_count == len(messages) == 4
+        assert contents(messages) == [f"message {i}" for i in range(4)]
+
+    asyncio.run(scenario())
+
+
+def test_corrupted_legacy_file_is_renamed(tmp_path: Path) -> None:
+    """A legacy file that cannot be parsed is moved aside instead of retried."""
+    (tmp_path / "room.json").write_text('{"room_id": "room", "messages": [')
+
+    history = HistoryManager(tmp_path)
+
+    assert not (tmp_path / "room.json").exists()
+    assert len(list(tmp_path.glob("room.corrupted.*.json"))) == 1
+    assert asyncio.run(history.get_room_metadata("room")) is None
+
+
+def test_segment_is_sealed_before_the_next_one_is_written(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """A crash while sealing a full tail must not leave lines in the next segment."""
+    monkeypatch.setattr(history_module, "SEGMENT_SIZE", 4)
+    monkeypatch.setattr(history_module, "MAX_BATCH_SIZE", 2)
+    history = HistoryManager(tmp_path)
+
+    async def fill_tail() -> None:
+        await asyncio.gather(
+            *(history.add_message("room", make_message(i)) for i in range(4))
+        )
+
+    asyncio.run(fill_tail())
+
+    def crash(*args: Any, **kwargs: Any) -> None:
+        raise OSError("simulated crash")
+
+    monkeypatch.setattr(history, "_save_manifest", crash)
+    with pytest.raises(OSError):
+        asyncio.run(history.add_message("room", make_message(4)))
+
+    assert not (tmp_path / "room.0001.jsonl").exists()
+
+
+def small_segments(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Shrink segments so tests can cross several segment boundaries."""
+    monkeypatch.setattr(history_module, "SEGMENT_SIZE", 5)
+    monkeypatch.setattr(history_module, "MAX_BATCH_SIZE", 3)
+
+
+async def add_messages(history: HistoryManager, count: int, start: int = 0) -> None:
+    """Add numbered messages one at a time."""
+    for index in range(start, start + count):
+        await history.add_message("room", make_message(index))
+
+
+def test_migrates_baseline_room_file(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """A single-document {room_id}.json is split into segments and a manifest."""
+    small_segments(monkeypatch)
+    messages: list[dict[str, Any]] = []
+    for index in range(12):
+        message = make_message(index, "Alice" if index % 2 else "Bob").to_dict()
+        # The baseline stored sender_name and room_id on every message
+        message["sender_name"] = message.pop("sender")
+        message["room_id"] = "room"
+        messages.append(message)
+    legacy = {
+        "room_id": "room",
+        "created_at": "2025-01-01T00:00:00",
+        "participants": ["Alice", "Bob"],
+        "messages": messages,
+    }
+    (tmp_path / "room.json").write_text(json.dumps(legacy))
+
+    history = HistoryManager(tmp_path)
+
+    assert (tmp_path / "room.json.bak").exists()
+    assert sorted(p.name for p in tmp_path.glob("room.0*.jsonl")) == [
+        "room.0000.jsonl",
+        "room.0001.jsonl",
+        "room.0002.jsonl",
+    ]
+    manifest = json.loads((tmp_path / "room.manifest.json").read_text())
+    assert manifest["segments"] == [5, 5]
+    assert manifest["participants"] == ["Alice", "Bob"]
+
+    metadata = asyncio.run(history.get_room_metadata("room"))
+    assert metadata is not None
+    assert metadata.message_count == 12
+    assert metadata.created_at == "2025-01-01T00:00:00"
+    migrated = asyncio.run(history.get_history("room"))
+    assert [m.content for m in migrated] == [f"message {i}" for i in range(12)]
+    assert migrated[1].sender_name == "Alice"
+    assert migrated[0].room_id == "room"
+
+
+def test_migrates_jsonl_log_with_meta_sidecar(tmp_path: Path) -> None:
+    """A {room_id}.jsonl log and its .meta.json sidecar are migrated together."""
+    lines = [json.dumps(make_message(i).to_dict()) for i in range(3)]
+    (tmp_path / "room.jsonl").write_text("\n".join(lines) + "\n")
+    (tmp_path / "room.meta.json").write_text(
+        json.dumps({"room_id": "room", "created_at": "2025-01-01T00:00:00"})
+    )
+
+    history = HistoryManager(tmp_path)
+
+    assert (tmp_path / "room.jsonl.bak").exists()
+    assert (tmp_path / "room.meta.json.bak").exists()
+    raw = asyncio.run(history.get_history_raw("room"))
+    assert contents(raw) == ["message 0", "message 1", "message 2"]
+
+
+@pytest.mark.parametrize("limit", [1, 3, 5, 6, 11, 13, 100, None])
+def test_limit_windows_across_segment_boundaries(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, limit: int | None
+) -> None:
+    """Any limit returns exactly the most recent messages, cold or cached."""
+    small_segments(monkeypatch)
+    expected = [f"message {i}" for i in range(13)]
+    if limit is not None:
+        expected = expected[-limit:]
+
+    async def scenario() -> None:
+        history = HistoryManager(tmp_path)
+        await add_messages(history, 13)
+        assert contents(await history.get_history_raw("room", limit)) == expected
+
+        # A fresh manager has no cache and decodes only what is asked for
+        cold = HistoryManager(tmp_path)
+        assert contents(await cold.get_history_raw("room", limit)) == expected
+        assert contents(await cold.get_history_raw("room", limit)) == expected
+
+    asyncio.run(scenario())
+
+
+def test_history_survives_restart(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Messages, participants and counts reload from disk and keep growing."""
+    small_segments(monkeypatch)
+
+    async def first_run() -> None:
+        history = HistoryManager(tmp_path)
+        await add_messages(history, 7)
+        await history.add_message("room", make_message(7, "Bob"))
+
+    async def second_run() -> None:
+        history = HistoryManager(tmp_path)
+        metadata = await history.get_room_metadata("room")
+        assert metadata is not None
+        assert metadata.message_count == 8
+        assert metadata.participants == ["Alice", "Bob"]
+        assert metadata.last_activity == make_message(7).timestamp
+
+        await add_messages(history, 4, start=8)
+        assert await history.get_message_count("room") == 12
+
+    async def third_run() -> None:
+        history = HistoryManager(tmp_path)
+        raw = await history.get_history_raw("room")
+        assert contents(raw) == [f"message {i}" for i in range(12)]
+        assert await history.get_message_count("room") == 12
+
+    asyncio.run(first_run())
+    asyncio.run(second_run())
+    asyncio.run(third_run())
+
+
+def test_concurrent_add_message_keeps_call_order(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Concurrent writers are batched but persisted in the order they called."""
+    small_segments(monkeypatch)
+
+    async def scenario() -> None:
+        history = HistoryManager(tmp_path)
+        await asyncio.gather(
+            *(history.add_message("room", make_message(i)) for i in range(23))
+        )
+        assert await history.get_message_count("room") == 23
+
+    asyncio.run(scenario())
+
+    history = HistoryManager(tmp_path)
+    raw = asyncio.run(history.get_history_raw("room"))
+    assert contents(raw) == [f"message {i}" for i in range(23)]
+    manifest = json.loads((tmp_path / "room.manifest.json").read_text())
+    assert manifest["segments"] == [5, 5, 5, 5]
+
+
+def test_cached_message_window_is_capped(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Writes and large reads never leave more than the cap decoded in memory."""
+    small_segments(monkeypatch)
+    monkeypatch.setattr(history_module, "MAX_CACHED_MESSAGES", 4)
+
+    async def scenario() -> None:
+        history = HistoryManager(tmp_path)
+        await add_messages(history, 12)
+        data = await history._load_room_data("room")
+        assert data is not None
+        assert len(data["messages"]) == 4
+        assert data["window_start"] == 8
+
+        raw = await history.get_history_raw("room")
+        assert contents(raw) == [f"message {i}" for i in range(12)]
+        assert len(data["messages"]) == 4
+        assert data["window_start"] == 8
+
+        raw = await history.get_history_raw("room", 6)
+        assert contents(raw) == [f"message {i}" for i in range(6, 12)]
+
+    asyncio.run(scenario())
+
+
+def test_corrupted_middle_line_keeps_window_aligned(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """A bad line only hides itself, across limit reads and window trims."""
+    small_segments(monkeypatch)
+    monkeypatch.setattr(history_module, "MAX_CACHED_MESSAGES", 3)
+    asyncio.run(add_messages(HistoryManager(tmp_path), 12))
+
+    # Message 6 is the second line of segment 1
+    segment = tmp_path / "room.0001.jsonl"
+    lines = segment.read_bytes().splitlines(keepends=True)
+    lines[1] = b"garbage\n"
+    segment.write_bytes(b"".join(lines))
+    healthy = [f"message {i}" for i in range(12) if i != 6]
+
+    async def scenario() -> None:
+        history = HistoryManager(tmp_path)
+        limited = await history.get_history_raw("room", 8)
+        assert contents(limited) == [f"message {i}" for i in (4, 5, 7, 8, 9, 10, 11)]
+        assert contents(await history.get_history_raw("room")) == healthy
+        assert contents(await history.get_history_raw("room", 3)) == healthy[-3:]
+        assert await history.get_message_count("room") == 12
+
+    asyncio.run(scenario())
+
+
+def test_invalid_message_dict_only_fails_its_own_call(tmp_path: Path) -> None:
+    """A malformed dict is rejected without failing the batch it would join."""
+    legacy_shape = {**make_message(2).to_dict(), "room_id": "room"}
+    legacy_shape["sender_name"] = legacy_shape.pop("sender")
+
+    async def scenario() -> tuple[BaseException | None, ...]:
+        history = HistoryManager(tmp_path)
+        return await asyncio.gather(
+            history.add_message("room", make_message(0)),
+            history.add_message("room", {"message_id": "msg-1", "content": "x"}),
+            history.add_message("room", legacy_shape),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(scenario())
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], ValueError)
+
+    raw = asyncio.run(HistoryManager(tmp_path).get_history_raw("room"))
+    assert contents(raw) == ["message 0", "message 2"]
+    assert raw[1]["sender"] == "Alice"
+
+
+def test_messages_are_stored_in_the_response_shape(tmp_path: Path) -> None:
+    """Stored lines hold exactly the get_history tool fields, nothing internal."""
+    history = HistoryManager(tmp_path)
+    asyncio.run(history.add_message("room", make_message(0)))
+
+    stored = json.loads((tmp_path / "room.0000.jsonl").read_text())
+    assert set(stored) == {"sender", "content", "timestamp", "message_id", "is_system"}
+
+
+def test_interrupted_migration_runs_again(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """A crash before the manifest is saved leaves no half-migrated room behind."""
+    small_segments(monkeypatch)
+    messages = [{**make_message(i).to_dict(), "room_id": "room"} for i in range(7)]
+    (tmp_path / "room.json").write_text(json.dumps({"messages": messages}))
+
+    def crash(*args: Any, **kwargs: Any) -> None:
+        raise OSError("simulated crash")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(HistoryManager, "_save_manifest", crash)
+        history = HistoryManager(tmp_path)
+
+    assert (tmp_path / "room.json").exists()
+    assert not list(tmp_path.glob("room.0*"))
+    assert not list(tmp_path.glob("room.manifest*"))
+    assert asyncio.run(history.get_room_metadata("room")) is None
+
+    history = HistoryManager(tmp_path)
+    assert (tmp_path / "room.json.bak").exists()
+    raw = asyncio.run(history.get_history_raw("room"))
+    assert contents(raw) == [f"message {i}" for i in range(7)]
+
+
+@pytest.mark.parametrize("mmap_threshold", [0, 1 << 20])
+def test_whitespace_lines_are_skipped_when_counting_and_reading(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, mmap_threshold: int
+) -> None:
+    """Buffered and memory-mapped segments agree on which lines are messages."""
+    monkeypatch.setattr(history_module, "MMAP_THRESHOLD_BYTES", mmap_threshold)
+    lines = [json.dumps(make_message(i).to_dict()) for i in range(3)]
+    (tmp_path / "room.0000.jsonl").write_text(
+        f"{lines[0]}\n \t\n{lines[1]}\n\n{lines[2]}\n"
+    )
+
+    async def scenario() -> None:
+        history = HistoryManager(tmp_path)
+        assert await history.get_message_count("room") == 3
+        raw = await history.get_history_raw("room")
+        assert contents(raw) == ["message 0", "message 1", "message 2"]
+
+    asyncio.run(scenario())